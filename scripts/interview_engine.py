@@ -2,6 +2,8 @@ import os
 import re
 import random
 import time
+import difflib
+import threading
 from collections import defaultdict
 from sentence_transformers import SentenceTransformer, util
 
@@ -20,12 +22,25 @@ SESSION = {
     "current_concept": None,
     "current_level": "easy",
     "current_question": None,
+    "question_id": 0,   # bumped on every new question, echoed back by drafts
     "scores": defaultdict(list),
-    "attempted": 0
+    "attempted": 0,
+    "draft": None,      # {"question", "text", "embedding"} encoded while typing
+    "prepared": None    # next question picked ahead of time from the draft
 }
 
 QUESTION_BANK = {}
 
+# Key point embeddings, keyed by question text and points
+POINT_EMBEDDINGS = {}
+
+# A draft this similar to the submitted answer reuses its embedding
+DRAFT_MATCH_RATIO = 0.95
+
+# Newest draft text; older drafts still encoding are discarded
+draft_lock = threading.Lock()
+latest_draft = {"text": None}
+
 
 # ==========================================================
 # PARSE FILE
@@ -69,6 +84,8 @@ def start_interview():
     SESSION["start_time"] = time.time()
     SESSION["scores"].clear()
     SESSION["attempted"] = 0
+    SESSION["draft"] = None
+    SESSION["prepared"] = None
 
     return pick_question()
 
@@ -76,6 +93,17 @@ def start_interview():
 # ==========================================================
 # PICK NEXT QUESTION (ADAPTIVE)
 # ==========================================================
+def choose_question(level):
+    concept = random.choice(list(QUESTION_BANK.keys()))
+
+    if not QUESTION_BANK[concept][level]:
+        level = "easy"
+
+    q = random.choice(QUESTION_BANK[concept][level])
+
+    return concept, level, q
+
+
 def pick_question():
 
     # time over?
@@ -83,21 +111,128 @@ def pick_question():
         SESSION["active"] = False
         return None
 
-    concept = random.choice(list(QUESTION_BANK.keys()))
-
-    level = SESSION["current_level"]
+    wanted = SESSION["current_level"]
 
-    if not QUESTION_BANK[concept][level]:
-        level = "easy"
+    with draft_lock:
+        prepared = SESSION["prepared"]
 
-    q = random.choice(QUESTION_BANK[concept][level])
+    # use the question prepared while the student was typing if the
+    # difficulty guess was right
+    if prepared and prepared["level"] == wanted:
+        concept, level, q = prepared["concept"], prepared["chosen_level"], prepared["question"]
+    else:
+        concept, level, q = choose_question(wanted)
 
-    SESSION["current_concept"] = concept
-    SESSION["current_question"] = q
+    # switch question and invalidate drafts in one step, so a draft
+    # finishing now cannot be stored against the new question
+    with draft_lock:
+        SESSION["current_concept"] = concept
+        SESSION["current_question"] = q
+        SESSION["question_id"] += 1
+        SESSION["draft"] = None
+        SESSION["prepared"] = None
 
     return f"[{concept} - {level.upper()}]\n{q['question']}"
 
 
+# ==========================================================
+# SCORING HELPERS
+# ==========================================================
+def point_embeddings(q):
+    key = (q["question"], tuple(q["points"]))
+
+    if key not in POINT_EMBEDDINGS:
+        POINT_EMBEDDINGS[key] = model.encode(q["points"], convert_to_tensor=True)
+
+    return POINT_EMBEDDINGS[key]
+
+
+def score_embedding(answer_emb, q):
+    points = q["points"]
+
+    if not points:
+        return 50
+
+    sims = util.cos_sim(answer_emb, point_embeddings(q))[0]
+
+    matched = sum(1 for s in sims if s > 0.45)
+    return int((matched / len(points)) * 100)
+
+
+def level_for(score):
+    if score > 75:
+        return "hard"
+    if score > 40:
+        return "medium"
+    return "easy"
+
+
+# ==========================================================
+# SPECULATIVE DRAFT ENCODING
+# ==========================================================
+def submit_draft(text, question_id):
+    """
+    Encode an in-progress answer for the question the page is showing.
+    Runs on the caller's thread so the web layer decides how many encodes
+    run at once. Drafts for an older question, or overtaken by a newer
+    draft, are dropped. Returns True if the draft was stored.
+    """
+    if not SESSION["active"] or not SESSION["current_question"] or not text.strip():
+        return False
+
+    with draft_lock:
+        if question_id != SESSION["question_id"]:
+            return False
+
+        latest_draft["text"] = text
+        question = SESSION["current_question"]
+
+    return encode_draft(text, question_id, question)
+
+
+def encode_draft(text, question_id, question):
+    try:
+        embedding = model.encode(text, convert_to_tensor=True)
+
+        # guess the next level from the draft and get that question ready
+        level = level_for(score_embedding(embedding, question))
+        concept, chosen_level, next_q = choose_question(level)
+        point_embeddings(next_q)
+
+        with draft_lock:
+            if SESSION["question_id"] != question_id or latest_draft["text"] != text:
+                return False
+
+            SESSION["draft"] = {"question": question, "text": text, "embedding": embedding}
+            SESSION["prepared"] = {
+                "level": level,
+                "chosen_level": chosen_level,
+                "concept": concept,
+                "question": next_q
+            }
+            return True
+    except Exception as e:
+        print("DRAFT ENCODE ERROR:", e)
+        return False
+
+
+def draft_embedding(answer):
+    """Embedding of a matching draft for the current question, if any."""
+    with draft_lock:
+        draft = SESSION["draft"]
+
+    if not draft or draft["question"] is not SESSION["current_question"]:
+        return None
+
+    a = " ".join(answer.lower().split())
+    b = " ".join(draft["text"].lower().split())
+
+    if a == b or difflib.SequenceMatcher(None, a, b).ratio() >= DRAFT_MATCH_RATIO:
+        return draft["embedding"]
+
+    return None
+
+
 # ==========================================================
 # EVALUATE ANSWER (SEMANTIC SCORING)
 # ==========================================================
@@ -106,31 +241,23 @@ def evaluate_answer(answer):
     if not SESSION["active"] or not SESSION["current_question"]:
         return 0, "Interview not active"
 
-    answer_emb = model.encode(answer, convert_to_tensor=True)
+    answer_emb = draft_embedding(answer)
+    if answer_emb is None:
+        answer_emb = model.encode(answer, convert_to_tensor=True)
 
-    points = SESSION["current_question"]["points"]
-
-    if not points:
-        score = 50
-    else:
-        pts_emb = model.encode(points, convert_to_tensor=True)
-        sims = util.cos_sim(answer_emb, pts_emb)[0]
-
-        matched = sum(1 for s in sims if s > 0.45)
-        score = int((matched / len(points)) * 100)
+    score = score_embedding(answer_emb, SESSION["current_question"])
 
     SESSION["scores"][SESSION["current_concept"]].append(score)
     SESSION["attempted"] += 1
 
     # Adaptive difficulty
+    SESSION["current_level"] = level_for(score)
+
     if score > 75:
-        SESSION["current_level"] = "hard"
         feedback = "Strong answer"
     elif score > 40:
-        SESSION["current_level"] = "medium"
         feedback = "Okay answer"
     else:
-        SESSION["current_level"] = "easy"
         feedback = "Weak answer"
 
     return score, feedback
@@ -0,0 +1,236 @@
+import os
+import time
+import cv2
+
+# ==========================================================
+# PRESENCE STATE (read by the web app)
+# ==========================================================
+PRESENCE = {
+    "present": True,
+    "running": False,
+    "checks": 0,
+    "full_scans": 0,
+    "roi_hits": 0,
+    "failed_reads": 0,
+    "cpu_ms_last": 0.0,
+    "cpu_ms_avg": 0.0,
+    "interval": 0.0
+}
+
+DETECT_WIDTH = 320          # frames are downscaled to this width before detection
+ROI_MARGIN = 0.5            # search box = last face grown by this fraction on each side
+ACTIVE_INTERVAL = 1.0       # seconds between checks during an interview
+IDLE_INTERVAL = 5.0         # seconds between checks when no interview is running
+MAX_BACKOFF = 10.0          # longest wait after repeated failed reads
+
+
+# ==========================================================
+# CAMERA SOURCES
+# ==========================================================
+class CameraSource:
+    """Live webcam (or any cv2.VideoCapture index / URL)."""
+
+    def __init__(self, device=0):
+        self.cap = cv2.VideoCapture(device)
+        self.exhausted = False  # a webcam never runs out of frames
+
+    def read(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(CameraSource):
+    """Recorded video, restarted from the beginning when it ends (unless loop=False)."""
+
+    def __init__(self, path, loop=True):
+        super().__init__(path)
+        self.loop = loop
+
+    def read(self):
+        frame = super().read()
+        if frame is None and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            frame = super().read()
+        elif frame is None:
+            self.exhausted = True
+        return frame
+
+
+class FakeSource:
+    """Serves a fixed list of frames (None = failed read). Used for tests."""
+
+    def __init__(self, frames, loop=True):
+        self.frames = list(frames)
+        self.loop = loop
+        self.pos = 0
+        self.exhausted = False
+
+    def read(self):
+        if self.pos >= len(self.frames):
+            if not self.loop or not self.frames:
+                self.exhausted = True
+                return None
+            self.pos = 0
+        frame = self.frames[self.pos]
+        self.pos += 1
+        return frame
+
+    def release(self):
+        pass
+
+
+def open_source(spec=None):
+    """
+    Pick a source from LABBOT_CAMERA: empty / a number -> webcam index,
+    anything else -> path or URL of a video.
+    """
+    spec = spec if spec is not None else os.environ.get("LABBOT_CAMERA", "")
+    spec = str(spec).strip()
+
+    if spec == "":
+        return CameraSource(0)
+
+    if spec.isdigit():
+        return CameraSource(int(spec))
+
+    return VideoFileSource(spec)
+
+
+# ==========================================================
+# DETECTOR
+# ==========================================================
+class PresenceDetector:
+    """
+    Haar face detector that works on a downscaled frame and first looks
+    around the last face it found before falling back to a full scan.
+    """
+
+    def __init__(self, detect_width=DETECT_WIDTH, roi_margin=ROI_MARGIN):
+        self.cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        self.detect_width = detect_width
+        self.roi_margin = roi_margin
+        self.last_face = None  # (x, y, w, h) in downscaled coordinates
+
+    def prepare(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        h, w = gray.shape[:2]
+
+        if w > self.detect_width:
+            scale = self.detect_width / w
+            gray = cv2.resize(gray, (self.detect_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        return gray
+
+    def roi(self, shape):
+        x, y, w, h = self.last_face
+        mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(shape[1], x + w + mx), min(shape[0], y + h + my)
+
+        return x0, y0, x1, y1
+
+    def detect(self, gray):
+        return self.cascade.detectMultiScale(gray, 1.3, 5)
+
+    def check(self, frame):
+        """Returns (present, used_full_scan)."""
+        gray = self.prepare(frame)
+
+        if self.last_face is not None:
+            x0, y0, x1, y1 = self.roi(gray.shape)
+            faces = self.detect(gray[y0:y1, x0:x1])
+
+            if len(faces) > 0:
+                fx, fy, fw, fh = faces[0]
+                self.last_face = (fx + x0, fy + y0, fw, fh)
+                return True, False
+
+        faces = self.detect(gray)
+
+        if len(faces) > 0:
+            self.last_face = tuple(faces[0])
+            return True, True
+
+        self.last_face = None
+        return False, True
+
+
+# ==========================================================
+# LOOP
+# ==========================================================
+def record_check(cpu_ms, full_scan):
+    PRESENCE["checks"] += 1
+    PRESENCE["cpu_ms_last"] = round(cpu_ms, 3)
+
+    # moving average keeps the number stable for the dashboard
+    avg = PRESENCE["cpu_ms_avg"]
+    PRESENCE["cpu_ms_avg"] = round(cpu_ms if PRESENCE["checks"] == 1 else 0.9 * avg + 0.1 * cpu_ms, 3)
+
+    if full_scan:
+        PRESENCE["full_scans"] += 1
+    else:
+        PRESENCE["roi_hits"] += 1
+
+
+def presence_loop(source, is_active=lambda: True, detector=None, max_checks=None):
+    """
+    Check presence until stop_presence() is called, this loop has made
+    max_checks checks, or a non-looping source runs out of frames.
+    Runs every ACTIVE_INTERVAL while is_active() is true, IDLE_INTERVAL
+    otherwise, and backs off exponentially while reads keep failing.
+    """
+    # keep detectMultiScale on this thread so thread_time() sees all of
+    # its CPU and presence never takes more than one core
+    cv2.setNumThreads(1)
+
+    detector = detector or PresenceDetector()
+    backoff = 0.0
+    checks = 0
+
+    PRESENCE["running"] = True
+
+    try:
+        while PRESENCE["running"]:
+            if max_checks is not None and checks >= max_checks:
+                break
+
+            frame = source.read()
+
+            if frame is None:
+                if getattr(source, "exhausted", False):
+                    break
+
+                PRESENCE["failed_reads"] += 1
+                backoff = min(MAX_BACKOFF, backoff * 2 if backoff else 0.5)
+                time.sleep(backoff)
+                continue
+
+            backoff = 0.0
+
+            cpu_start = time.thread_time()
+            present, full_scan = detector.check(frame)
+            record_check((time.thread_time() - cpu_start) * 1000, full_scan)
+            checks += 1
+
+            PRESENCE["present"] = present
+
+            interval = ACTIVE_INTERVAL if is_active() else IDLE_INTERVAL
+            PRESENCE["interval"] = interval
+            time.sleep(interval)
+    finally:
+        source.release()
+        PRESENCE["running"] = False
+
+
+def stop_presence():
+    PRESENCE["running"] = False
+
+
+def presence_stats():
+    return dict(PRESENCE)
@@ -0,0 +1,187 @@
+"""
+Replay recorded LabBot traffic against a running server.
+
+Record traffic first by starting the web app with
+    LABBOT_TRAFFIC_LOG=traffic.jsonl python app.py
+
+Then replay it, e.g. at 4x the recorded pace with 16 concurrent clients:
+    python replay_traffic.py traffic.jsonl --url http://localhost:10000 --speed 4 --concurrency 16
+
+Reports p50/p95/p99 latency, p99 of successful requests only (so fast
+429/503 rejections do not flatter the tail), error rate and throughput
+per endpoint, and the request rate actually achieved next to the one
+asked for.
+
+Latency is measured from when each request was due by the recorded
+schedule, not from when a client thread got round to sending it, so time
+spent waiting for a free client under overload is included.
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ---------------- LOAD RECORDING ----------------
+def load_records(path):
+    records = []
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            records.append(json.loads(line))
+
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+# ---------------- SEND ONE REQUEST ----------------
+def send_request(base_url, record, timeout):
+    url = base_url.rstrip("/") + record["endpoint"]
+    data = None
+    headers = {}
+
+    if record.get("method", "GET") == "POST":
+        data = json.dumps(record.get("payload") or {}).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+
+    req = urllib.request.Request(url, data=data, headers=headers, method=record.get("method", "GET"))
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, http.client.HTTPException, OSError):
+        # no usable response (refused, reset, truncated body...): still a
+        # sample, counted as an error
+        status = None
+
+    return status, time.perf_counter() - start
+
+
+# ---------------- REPLAY ----------------
+def replay(records, base_url, speed=1.0, concurrency=8, timeout=30.0):
+    results = defaultdict(list)  # endpoint -> [(status, latency, queue wait)]
+    lock = threading.Lock()
+
+    def worker(record, due_at):
+        queue_wait = time.perf_counter() - due_at
+        status, _ = send_request(base_url, record, timeout)
+
+        # latency from the scheduled send time (avoids coordinated omission)
+        latency = time.perf_counter() - due_at
+
+        with lock:
+            results[record["endpoint"]].append((status, latency, queue_wait))
+
+    if not records:
+        return results, 0.0
+
+    t0 = records[0]["ts"]
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            # keep the recorded gaps between requests, scaled by speed
+            due = (record["ts"] - t0) / speed
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(worker, record, start + due)
+
+    return results, time.perf_counter() - start
+
+
+# ---------------- REPORT ----------------
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[idx]
+
+
+def summarize(results, wall_time):
+    summary = {}
+
+    for endpoint, samples in sorted(results.items()):
+        latencies = [lat * 1000 for _, lat, _ in samples]
+        waits = [wait * 1000 for _, _, wait in samples]
+        ok_latencies = [lat * 1000 for status, lat, _ in samples if status is not None and status < 400]
+        errors = len(samples) - len(ok_latencies)
+
+        summary[endpoint] = {
+            "requests": len(samples),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "p99_queue_ms": round(percentile(waits, 99), 1),
+            "p99_ok_ms": round(percentile(ok_latencies, 99), 1),
+            "error_rate": round(errors / len(samples), 4),
+            "throughput_rps": round(len(samples) / wall_time, 2) if wall_time else 0.0
+        }
+
+    return summary
+
+
+def summarize_rate(records, results, speed, wall_time):
+    """Offered request rate (recording at `speed`) against what was achieved."""
+    span = (records[-1]["ts"] - records[0]["ts"]) / speed if records else 0.0
+    completed = sum(len(samples) for samples in results.values())
+
+    return {
+        "requested_rps": round(len(records) / span, 2) if span > 0 else None,
+        "achieved_rps": round(completed / wall_time, 2) if wall_time else 0.0
+    }
+
+
+def print_report(summary, rate, wall_time):
+    print(f"\nReplay finished in {wall_time:.1f}s")
+
+    requested = rate["requested_rps"]
+    print(f"Requested rate: {requested if requested is not None else '-'} req/s, "
+          f"achieved: {rate['achieved_rps']} req/s\n")
+
+    print(f"{'endpoint':<18}{'reqs':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'p99 queue':>11}{'p99 ok':>10}{'errors':>9}{'req/s':>9}")
+
+    for endpoint, s in summary.items():
+        print(
+            f"{endpoint:<18}{s['requests']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}"
+            f"{s['p99_ms']:>10}{s['p99_queue_ms']:>11}{s['p99_ok_ms']:>10}"
+            f"{s['error_rate'] * 100:>8.1f}%{s['throughput_rps']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded LabBot traffic")
+    parser.add_argument("recording", help="JSONL file written by LABBOT_TRAFFIC_LOG")
+    parser.add_argument("--url", default="http://localhost:10000")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, N = N times faster")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    records = load_records(args.recording)
+    print(f"Replaying {len(records)} requests at {args.speed}x with {args.concurrency} clients...")
+
+    results, wall_time = replay(records, args.url, args.speed, args.concurrency, args.timeout)
+    summary = summarize(results, wall_time)
+    rate = summarize_rate(records, results, args.speed, wall_time)
+
+    if args.json:
+        print(json.dumps({"rate": rate, "endpoints": summary}, indent=2))
+    else:
+        print_report(summary, rate, wall_time)
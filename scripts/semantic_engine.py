@@ -1,30 +1,89 @@
 import os
 import re
+import json
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+import torch
+from sentence_transformers import SentenceTransformer
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ---------- MULTI SUBJECT KB ----------
-KB_FILES = {
-    "os": os.path.join(BASE_DIR, "../syllabus_text/cleaned/os_knowledge_base.txt"),
-    "dbms": os.path.join(BASE_DIR, "../syllabus_text/cleaned/dbms_knowledge_base.txt"),
-    "cn": os.path.join(BASE_DIR, "../syllabus_text/cleaned/cn_knowledge_base.txt")
-}
+# Every "<subject>_knowledge_base.txt" in KB_DIR is a subject
+KB_DIR = os.environ.get("LABBOT_KB_DIR", os.path.join(BASE_DIR, "../syllabus_text/cleaned"))
+KB_SUFFIX = "_knowledge_base.txt"
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Encoded indexes are cached here so later starts skip the encoder
+INDEX_DIR = os.environ.get("LABBOT_INDEX_DIR", os.path.join(BASE_DIR, "../syllabus_text/index_cache"))
 
-# Each subject stores its own vectors  
-SUBJECT_DATA = {}
+# Memory allowed for loaded subject indexes before the least used is dropped
+INDEX_BUDGET_MB = float(os.environ.get("LABBOT_INDEX_BUDGET_MB", 256))
 
-# ---------- SUBJECT DETECTION ----------
-subject_keywords = {
-    "os": "process scheduling deadlock paging semaphore cpu thread synchronization memory",
-    "dbms": "sql database normalization transaction schema er diagram table key relation",
-    "cn": "network osi tcp ip routing packet dns protocol topology"
+KB_FILES = {}
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+model = SentenceTransformer(MODEL_NAME)
+
+# Index build settings (can be overridden per call)
+ENCODE_BATCH_SIZE = int(os.environ.get("LABBOT_ENCODE_BATCH", 64))
+ENCODE_WORKERS = int(os.environ.get("LABBOT_ENCODE_WORKERS", 1))
+
+# Texts held in memory at once while indexing = batch size * this
+STREAM_WINDOW_BATCHES = int(os.environ.get("LABBOT_STREAM_WINDOW", 16))
+
+# Rows scored per step when searching an on-disk index
+SCORE_CHUNK = 65536
+
+# Bump when the on-disk index layout changes so old caches get rebuilt
+INDEX_FORMAT = 4
+
+# ---------- RETRIEVAL CASCADE ----------
+# Lexical tier answers only when the best title overlap is at least
+# LEXICAL_MIN_SCORE and beats the runner-up by LEXICAL_MARGIN
+LEXICAL_MIN_SCORE = 0.6
+LEXICAL_MARGIN = 0.2
+
+# Query tokens in more titles than this are too common to pick
+# candidates with; they still count towards the score of the candidates
+LEXICAL_MAX_POSTING = 1000
+# More candidate titles than this and the lexical tier gives up (dense
+# search is cheaper than scoring them)
+LEXICAL_MAX_CANDIDATES = 2000
+
+QUERY_STOPWORDS = {
+    "what", "is", "are", "an", "the", "a", "explain", "define", "describe",
+    "how", "why", "does", "do", "of", "to", "in", "on", "and", "for",
+    "about", "tell", "me", "meaning", "by", "mean", "please"
+}
+
+# subject -> title lookup arrays memory-mapped from the index cache
+# (see TITLE_ARRAYS); reopened whenever that subject's index is loaded
+TITLE_TABLES = {}
+
+CASCADE_STATS = {
+    "queries": 0,
+    "tiers": {t: {"attempts": 0, "hits": 0, "time_ms": 0.0} for t in ("exact", "lexical", "dense")}
 }
+stats_lock = threading.Lock()
 
-subject_vectors = {s: model.encode(text, convert_to_tensor=True) for s, text in subject_keywords.items()}
+# Loaded subject indexes, least recently used first
+SUBJECT_DATA = OrderedDict()
+# Short lock around SUBJECT_DATA; slow loads/builds take the subject's own lock
+subject_lock = threading.Lock()
+BUILD_LOCKS = {}
+
+# ---------- SUBJECT DETECTION ----------
+# subject -> normalized mean of that subject's concept embeddings
+subject_vectors = {}
 
 
 # ---------------- LOAD & PARSE ----------------
@@ -78,48 +137,664 @@ def extract_description(block):
     return " ".join(collected)
 
 
+# ---------------- STREAMING READER ----------------
+def iter_concept_spans(path):
+    """
+    Read a knowledge base line by line and yield (start, end, block) for
+    each concept, where start/end are byte offsets into the file. Only one
+    concept is held in memory at a time.
+    """
+    marker = b"--- CONCEPT:"
+
+    with open(path, "rb") as f:
+        pos = 0
+        start = None
+        lines = []
+
+        for line in f:
+            if line.startswith(marker):
+                if start is not None:
+                    yield start, pos, b"".join(lines).decode("utf-8").strip()
+                start = pos
+                lines = []
+
+            if start is not None:
+                lines.append(line)
+
+            pos += len(line)
+
+        if start is not None:
+            yield start, pos, b"".join(lines).decode("utf-8").strip()
+
+
+def iter_semantic_texts(spans):
+    for start, end, block in spans:
+        title = extract_name(block)
+        desc = extract_description(block)
+
+        # combine meaning (VERY IMPORTANT)
+        yield start, end, title, f"{title}. {desc}"
+
+
+def iter_windows(items, size):
+    window = []
+
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+
+    if window:
+        yield window
+
+
+def read_concept(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        # "replace" so a KB edited mid-read garbles one answer instead of raising
+        return f.read(end - start).decode("utf-8", errors="replace").strip()
+
+
+# ---------------- BATCHED ENCODING ----------------
+def _init_encode_worker(threads):
+    # each worker gets its share of the cores instead of all of them
+    torch.set_num_threads(threads)
+
+
+def _encode_batch(batch):
+    return model.encode(batch, batch_size=len(batch), convert_to_numpy=True)
+
+
+def length_bucketed_batches(texts, batch_size):
+    """
+    Sort texts by token length and cut them into batches, so every batch
+    holds texts of similar length and pads very little.
+    Returns (order, batches) where order[i] is the original index of the
+    i-th sorted text.
+    """
+    token_ids = model.tokenizer(texts, add_special_tokens=False, truncation=False)["input_ids"]
+    limit = model.max_seq_length
+    lengths = [min(len(ids), limit) for ids in token_ids]
+
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    batches = [
+        [texts[i] for i in order[start:start + batch_size]]
+        for start in range(0, len(order), batch_size)
+    ]
+
+    return order, batches
+
+
+def encoder_pool(workers):
+    """Process pool for encode_texts, or None when encoding in-process."""
+    if workers <= 1:
+        return None
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_encode_worker,
+        initargs=(threads,)
+    )
+
+
+def encode_texts(texts, batch_size=None, workers=None, pool=None):
+    """
+    Encode texts in length buckets, optionally across a local process pool.
+    Embeddings come back normalized, as float32, in the original text order.
+    """
+    batch_size = batch_size or ENCODE_BATCH_SIZE
+    workers = workers or ENCODE_WORKERS
+
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    order, batches = length_bucketed_batches(texts, batch_size)
+
+    if pool is not None:
+        parts = list(pool.map(_encode_batch, batches))
+    elif workers > 1 and len(batches) > 1:
+        with encoder_pool(min(workers, len(batches))) as own_pool:
+            parts = list(own_pool.map(_encode_batch, batches))
+    else:
+        parts = [_encode_batch(batch) for batch in batches]
+
+    sorted_emb = np.concatenate(parts).astype(np.float32, copy=False)
+
+    # restore concept order
+    embeddings = np.empty_like(sorted_emb)
+    embeddings[order] = sorted_emb
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+# ---------------- SUBJECT DISCOVERY ----------------
+def discover_subjects():
+    global KB_FILES
+
+    found = {}
+    if os.path.isdir(KB_DIR):
+        for name in sorted(os.listdir(KB_DIR)):
+            if name.endswith(KB_SUFFIX):
+                found[name[:-len(KB_SUFFIX)]] = os.path.join(KB_DIR, name)
+
+    KB_FILES = found
+    return found
+
+
+# ---------------- INDEX CACHE ----------------
+def cache_paths(subject):
+    base = os.path.join(INDEX_DIR, subject)
+    return {
+        "meta": base + ".json",
+        "embeddings": base + ".emb.f32",
+        "offsets": base + ".offsets.i64",
+        "centroid": base + ".centroid.npy",
+        "exact_keys": base + ".exact.u64",
+        "exact_ids": base + ".exact_ids.i64",
+        "token_keys": base + ".tokens.u64",
+        "token_starts": base + ".token_starts.i64",
+        "postings": base + ".postings.i64",
+        "title_sizes": base + ".title_sizes.i32"
+    }
+
+
+def source_signature(path):
+    st = os.stat(path)
+    return {"mtime": st.st_mtime, "size": st.st_size, "model": MODEL_NAME, "format": INDEX_FORMAT}
+
+
+def read_meta(subject):
+    path = cache_paths(subject)["meta"]
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cache_is_fresh(subject):
+    meta = read_meta(subject)
+
+    if not meta or meta.get("source") != source_signature(KB_FILES[subject]):
+        return False
+
+    return all(os.path.exists(p) for p in cache_paths(subject).values())
+
+
 # ---------------- BUILD INDEX ----------------
-def build_vector_index():
-    global SUBJECT_DATA
+@contextmanager
+def cache_lock(subject, shared=False):
+    """
+    Lock on a subject's index cache that also holds across processes
+    (uvicorn workers share INDEX_DIR): exclusive while building, shared
+    while opening, so nobody opens a mix of files from two builds.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
 
-    for subject, path in KB_FILES.items():
+    with open(os.path.join(INDEX_DIR, subject + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
-        if not os.path.exists(path):
-            print(f"Missing KB: {subject}")
-            continue
 
-        with open(path, "r", encoding="utf-8") as f:
-            text = f.read()
+def build_subject_index(subject, batch_size=None, workers=None, pool=None):
+    """Build a subject's index cache unless another process just did."""
+    with cache_lock(subject):
+        if cache_is_fresh(subject):
+            return
+
+        write_subject_index(subject, batch_size, workers, pool)
+
+
+def write_subject_index(subject, batch_size=None, workers=None, pool=None):
+    """
+    Stream a knowledge base through parse -> semantic text -> encode and
+    append the vectors to an on-disk matrix. Only one window of texts and
+    their embeddings is in memory at a time, whatever the KB size (the
+    title keys collected alongside are 8-byte integers per token).
+    """
+    batch_size = batch_size or ENCODE_BATCH_SIZE
+    workers = workers or ENCODE_WORKERS
+    dim = model.get_sentence_embedding_dimension()
+
+    paths = cache_paths(subject)
+    tmp = {}
+
+    count = 0
+    vector_sum = np.zeros(dim, dtype=np.float64)
+    titles = TitleKeys()
+    start_time = time.perf_counter()
+
+    spans = iter_semantic_texts(iter_concept_spans(KB_FILES[subject]))
+
+    # a pool passed in is shared with other builds and left running
+    own_pool = pool is None
+    if own_pool:
+        pool = encoder_pool(workers)
+
+    try:
+        # unique names, so a crashed or concurrent build never shares them
+        for key, path in paths.items():
+            fd, tmp[key] = tempfile.mkstemp(dir=INDEX_DIR, prefix=os.path.basename(path) + ".", suffix=".tmp")
+            os.close(fd)
+
+        with open(tmp["embeddings"], "wb") as emb_file, open(tmp["offsets"], "wb") as off_file:
+            for window in iter_windows(spans, batch_size * STREAM_WINDOW_BATCHES):
+                texts = [text for _, _, _, text in window]
+                vectors = encode_texts(texts, batch_size, workers, pool)
+
+                emb_file.write(vectors.tobytes())
+                off_file.write(np.array([(a, b) for a, b, _, _ in window], dtype=np.int64).tobytes())
+
+                for _, _, title, _ in window:
+                    titles.add(title)
+
+                vector_sum += vectors.sum(axis=0)
+                count += len(window)
+
+        titles.write(tmp)
+
+        norm = np.linalg.norm(vector_sum)
+        centroid = (vector_sum / norm if norm > 0 else vector_sum).astype(np.float32)
+        with open(tmp["centroid"], "wb") as f:
+            np.save(f, centroid)
+
+        with open(tmp["meta"], "w", encoding="utf-8") as f:
+            json.dump({"source": source_signature(KB_FILES[subject]), "count": count, "dim": dim}, f)
+
+        # meta goes last so a half-written index is never seen as fresh
+        for key in [k for k in paths if k != "meta"] + ["meta"]:
+            os.replace(tmp[key], paths[key])
+    finally:
+        if own_pool and pool is not None:
+            pool.shutdown()
+
+        # left over only if the build failed
+        for path in tmp.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"{subject.upper()} indexed → {count} concepts ({count / elapsed:.1f} concepts/s)")
+
+
+def load_subject_index(subject):
+    """Open a subject's cached index as memory maps (building it if stale)."""
+    if not cache_is_fresh(subject):
+        build_subject_index(subject)
+
+    paths = cache_paths(subject)
+
+    with cache_lock(subject, shared=True):
+        meta = read_meta(subject)
+        count, dim = meta["count"], meta["dim"]
+
+        if count == 0:
+            embeddings = np.zeros((0, dim), dtype=np.float32)
+            offsets = np.zeros((0, 2), dtype=np.int64)
+        else:
+            embeddings = np.memmap(paths["embeddings"], dtype=np.float32, mode="r", shape=(count, dim))
+            offsets = np.memmap(paths["offsets"], dtype=np.int64, mode="r", shape=(count, 2))
+
+        # title lookup and routing must describe the index that is now on disk
+        refresh_subject_lookup(subject)
+
+        return {
+            "path": KB_FILES[subject],
+            "source": meta["source"],
+            "embeddings": embeddings,
+            "offsets": offsets,
+            "centroid": np.load(paths["centroid"])
+        }
+
+
+def concept_at(data, idx):
+    start, end = data["offsets"][idx]
+    return read_concept(data["path"], int(start), int(end))
+
+
+# ---------------- LRU OF LOADED SUBJECTS ----------------
+def index_bytes(data):
+    # worst case: every page of the memory maps resident
+    return data["embeddings"].nbytes + data["offsets"].nbytes
+
+
+def loaded_bytes():
+    return sum(index_bytes(d) for d in SUBJECT_DATA.values())
+
+
+def evict_to_budget():
+    budget = INDEX_BUDGET_MB * 1024 * 1024
+
+    # always keep the most recent subject, even if it alone is over budget
+    while len(SUBJECT_DATA) > 1 and loaded_bytes() > budget:
+        subject, _ = SUBJECT_DATA.popitem(last=False)
+        print(f"{subject.upper()} index evicted")
+
+
+def remember_subject(subject, data):
+    SUBJECT_DATA[subject] = data
+    SUBJECT_DATA.move_to_end(subject)
+    evict_to_budget()
+
+
+def build_lock(subject):
+    with subject_lock:
+        return BUILD_LOCKS.setdefault(subject, threading.Lock())
+
+
+def cached_subject(subject):
+    """Loaded index for subject, or None if not loaded or its KB changed."""
+    with subject_lock:
+        data = SUBJECT_DATA.get(subject)
+        if data is None:
+            return None
+
+        # offsets only make sense for the exact file they were built from
+        if data["source"] != source_signature(data["path"]):
+            del SUBJECT_DATA[subject]
+            print(f"{subject.upper()} knowledge base changed, reloading")
+            return None
+
+        SUBJECT_DATA.move_to_end(subject)
+        return data
+
+
+def get_subject(subject):
+    """
+    Return a subject's index, loading it on first use. Only requests for
+    the same subject wait on a load; other subjects are served meanwhile.
+    """
+    if subject not in KB_FILES or not os.path.exists(KB_FILES[subject]):
+        return None
+
+    data = cached_subject(subject)
+    if data is not None:
+        return data
 
-        concepts = split_into_concepts(text)
+    with build_lock(subject):
+        # someone else may have finished loading it while we waited
+        data = cached_subject(subject)
+        if data is not None:
+            return data
 
-        semantic_texts = []
-        for c in concepts:
-            title = extract_name(c)
-            desc = extract_description(c)
+        data = load_subject_index(subject)
 
-            # combine meaning (VERY IMPORTANT)
-            semantic_texts.append(f"{title}. {desc}")
+        with subject_lock:
+            remember_subject(subject, data)
 
-        embeddings = model.encode(semantic_texts, convert_to_tensor=True)
+        return data
 
-        SUBJECT_DATA[subject] = {
-            "concepts": concepts,
-            "embeddings": embeddings
+
+def index_stats():
+    with subject_lock:
+        return {
+            "subjects": sorted(KB_FILES),
+            "loaded": list(SUBJECT_DATA),
+            "loaded_mb": round(loaded_bytes() / (1024 * 1024), 3),
+            "budget_mb": INDEX_BUDGET_MB
+        }
+
+
+def build_vector_index(batch_size=None, workers=None):
+    """
+    Discover subjects and prepare their routing vectors. Subject indexes
+    themselves load lazily on first query; a subject is only encoded here
+    when its cache is missing or older than its knowledge base.
+    """
+    stale = [s for s in discover_subjects() if not cache_is_fresh(s)]
+
+    # one pool for every stale subject; starting workers means loading
+    # the model in each of them, which costs more than a small KB
+    pool = encoder_pool(workers or ENCODE_WORKERS) if stale else None
+
+    try:
+        for subject in stale:
+            with build_lock(subject):
+                with subject_lock:
+                    SUBJECT_DATA.pop(subject, None)
+                if not cache_is_fresh(subject):
+                    build_subject_index(subject, batch_size, workers, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for subject in KB_FILES:
+        with cache_lock(subject, shared=True):
+            refresh_subject_lookup(subject)
+
+    print(f"{len(KB_FILES)} subjects available: {', '.join(s.upper() for s in KB_FILES)}")
+
+
+# ---------------- TITLE LOOKUP ----------------
+def query_tokens(text):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return [w for w in words if w not in QUERY_STOPWORDS]
+
+
+def text_key(text):
+    """64-bit key for a token or title, the same in every process."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+# dtype of each title lookup array in the index cache
+TITLE_ARRAYS = {
+    "exact_keys": np.uint64,     # sorted keys of normalized titles
+    "exact_ids": np.int64,       # concept index for each exact key
+    "token_keys": np.uint64,     # sorted distinct title token keys
+    "token_starts": np.int64,    # postings[token_starts[i]:token_starts[i + 1]] belong to token i
+    "postings": np.int64,        # concept indexes, ascending within each token
+    "title_sizes": np.int32      # distinct tokens in each concept's title
+}
+
+
+class TitleKeys:
+    """Collects title keys during an index build and writes the lookup arrays."""
+
+    def __init__(self):
+        self.exact_keys = array("Q")
+        self.exact_ids = array("q")
+        self.token_keys = array("Q")
+        self.token_ids = array("q")
+        self.sizes = array("i")
+
+    def add(self, title):
+        idx = len(self.sizes)
+        tokens = query_tokens(title)
+        distinct = set(tokens)
+        self.sizes.append(len(distinct))
+
+        if not tokens:
+            return
+
+        self.exact_keys.append(text_key(" ".join(tokens)))
+        self.exact_ids.append(idx)
+
+        for t in distinct:
+            self.token_keys.append(text_key(t))
+            self.token_ids.append(idx)
+
+    def write(self, paths):
+        exact_keys = np.array(self.exact_keys, dtype=np.uint64)
+        exact_ids = np.array(self.exact_ids, dtype=np.int64)
+        order = np.argsort(exact_keys, kind="stable")
+
+        token_keys = np.array(self.token_keys, dtype=np.uint64)
+        token_ids = np.array(self.token_ids, dtype=np.int64)
+        order_t = np.lexsort((token_ids, token_keys))
+        token_keys, token_ids = token_keys[order_t], token_ids[order_t]
+
+        distinct, starts = np.unique(token_keys, return_index=True)
+
+        arrays = {
+            "exact_keys": exact_keys[order],
+            "exact_ids": exact_ids[order],
+            "token_keys": distinct,
+            "token_starts": np.append(starts, len(token_keys)),
+            "postings": token_ids,
+            "title_sizes": np.array(self.sizes, dtype=np.int32)
         }
 
-        print(f"{subject.upper()} loaded → {len(concepts)} concepts")
+        for key, values in arrays.items():
+            with open(paths[key], "wb") as f:
+                f.write(values.astype(TITLE_ARRAYS[key], copy=False).tobytes())
+
+
+def map_array(path, dtype):
+    # np.memmap cannot map an empty file
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def open_title_table(subject):
+    """
+    Memory-map a subject's title lookup arrays. They stay on disk; only
+    the pages a lookup touches are read, so they cost no index budget.
+    """
+    paths = cache_paths(subject)
+    return {key: map_array(paths[key], dtype) for key, dtype in TITLE_ARRAYS.items()}
+
+
+def refresh_subject_lookup(subject):
+    """Reopen a subject's title table and routing vector from its cache."""
+    global subject_vectors
+
+    table = open_title_table(subject)
+    centroid = np.load(cache_paths(subject)["centroid"])
+
+    # swap in new dicts so readers never see one being modified
+    TITLE_TABLES[subject] = table
+    subject_vectors = {**subject_vectors, subject: centroid}
+
+
+def find_key(keys, key):
+    """(first, end) positions of key in a sorted key array."""
+    key = np.uint64(key)
+    return int(np.searchsorted(keys, key, "left")), int(np.searchsorted(keys, key, "right"))
+
+
+def exact_lookup(tokens):
+    key = text_key(" ".join(tokens))
+
+    matches = []
+    for subject, table in list(TITLE_TABLES.items()):
+        lo, hi = find_key(table["exact_keys"], key)
+        matches.extend((subject, int(idx)) for idx in table["exact_ids"][lo:hi])
+
+    # same title twice is ambiguous, leave it to the next tier
+    if len(matches) != 1:
+        return None
+
+    subject, idx = matches[0]
+    return subject, idx, 1.0
+
+
+def lexical_scores(table, q_keys):
+    """
+    Jaccard scores of the titles that share a rare query token with the
+    query, plus an upper bound on the score of every other title.
+    None if there are too many candidates to score cheaply.
+    """
+    rare, common = [], []
+
+    for key in q_keys:
+        lo, hi = find_key(table["token_keys"], key)
+        if lo == hi:
+            continue
+
+        start, end = int(table["token_starts"][lo]), int(table["token_starts"][lo + 1])
+        posting = table["postings"][start:end]
+        (common if len(posting) > LEXICAL_MAX_POSTING else rare).append(posting)
+
+    # a title without any rare query token shares at most the common ones
+    bound = len(common) / len(q_keys)
+
+    if not rare:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), bound
+
+    ids, overlap = np.unique(np.concatenate(rare), return_counts=True)
+    if len(ids) > LEXICAL_MAX_CANDIDATES:
+        return None
+
+    for posting in common:
+        pos = np.minimum(np.searchsorted(posting, ids), len(posting) - 1)
+        overlap += np.asarray(posting[pos]) == ids
+
+    scores = overlap / (len(q_keys) + table["title_sizes"][ids] - overlap)
+    return ids, scores, bound
+
+
+def lexical_lookup(tokens):
+    q_keys = [text_key(t) for t in set(tokens)]
+
+    scored = []
+    bound = 0.0
+    for subject, table in list(TITLE_TABLES.items()):
+        result = lexical_scores(table, q_keys)
+        if result is None:
+            return None
+
+        ids, scores, subject_bound = result
+        bound = max(bound, subject_bound)
+
+        for i in np.argsort(scores)[-2:]:
+            scored.append((float(scores[i]), subject, int(ids[i])))
+
+    if not scored:
+        return None
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    best, subject, idx = scored[0]
+    runner_up = max(scored[1][0] if len(scored) > 1 else 0.0, bound)
+
+    if best < LEXICAL_MIN_SCORE or best - runner_up < LEXICAL_MARGIN:
+        return None
+
+    return subject, idx, best
+
+
+def title_hit_block(subject, idx, tokens, score):
+    """
+    Concept block for a title lookup hit, or None if the concept now at
+    idx does not score the same against the query (loading the subject
+    may have rebuilt it).
+    """
+    data = get_subject(subject)
+    if not data or idx >= len(data["offsets"]):
+        return None
+
+    block = concept_at(data, idx)
+    return block if jaccard(tokens, query_tokens(extract_name(block))) == score else None
 
 
 # ---------------- SUBJECT DETECTION ----------------
-def detect_subject(query):
-    q_emb = model.encode(query, convert_to_tensor=True)
+def encode_query(query):
+    return model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def detect_subject(query, q_vec=None):
+    if q_vec is None:
+        q_vec = encode_query(query)
 
     best_subject = None
     best_score = -1
 
     for subject, vec in subject_vectors.items():
-        score = util.cos_sim(q_emb, vec).item()
+        score = float(np.dot(q_vec, vec))
 
         if score > best_score:
             best_score = score
@@ -129,28 +804,97 @@ def detect_subject(query):
 
 
 # ---------------- SEARCH ----------------
-def search(query):
+def best_match(q_vec, embeddings):
+    """Cosine search over (normalized) embeddings, a chunk at a time."""
+    best_idx = -1
+    best_score = -1.0
 
-    if not SUBJECT_DATA:
-        build_vector_index()
+    for start in range(0, len(embeddings), SCORE_CHUNK):
+        scores = np.asarray(embeddings[start:start + SCORE_CHUNK]) @ q_vec
+        i = int(np.argmax(scores))
 
-    subject, confidence = detect_subject(query)
-    data = SUBJECT_DATA.get(subject)
+        if scores[i] > best_score:
+            best_idx = start + i
+            best_score = float(scores[i])
 
-    if not data:
-        return None, None
+    return best_idx, best_score
 
-    q_emb = model.encode(query, convert_to_tensor=True)
 
-    scores = util.cos_sim(q_emb, data["embeddings"])[0]
+def dense_search(query):
+    q_vec = encode_query(query)
 
-    best_idx = int(np.argmax(scores))
-    best_score = float(scores[best_idx])
+    subject, confidence = detect_subject(query, q_vec)
+    data = get_subject(subject)
+
+    if not data or len(data["embeddings"]) == 0:
+        return None, None
+
+    best_idx, best_score = best_match(q_vec, data["embeddings"])
 
     if best_score < 0.35:
         return None, subject
 
-    return data["concepts"][best_idx], subject
+    return concept_at(data, best_idx), subject
+
+
+def record_tier(tier, start, hit):
+    with stats_lock:
+        stats = CASCADE_STATS["tiers"][tier]
+        stats["attempts"] += 1
+        stats["hits"] += int(hit)
+        stats["time_ms"] += (time.perf_counter() - start) * 1000
+
+
+def search(query):
+    """
+    Cheap-first cascade: exact title, then lexical title match with a
+    confidence margin, and only then subject routing + dense scoring.
+    """
+    if not subject_vectors:
+        build_vector_index()
+
+    with stats_lock:
+        CASCADE_STATS["queries"] += 1
+
+    tokens = query_tokens(query)
+
+    if tokens:
+        for tier, lookup in (("exact", exact_lookup), ("lexical", lexical_lookup)):
+            start = time.perf_counter()
+            hit = lookup(tokens)
+            result = None
+
+            if hit:
+                subject, idx, score = hit
+                block = title_hit_block(subject, idx, tokens, score)
+                if block:
+                    result = (block, subject)
+
+            record_tier(tier, start, result is not None)
+            if result:
+                return result
+
+    start = time.perf_counter()
+    block, subject = dense_search(query)
+    record_tier("dense", start, block is not None)
+
+    return block, subject
+
+
+def cascade_stats():
+    with stats_lock:
+        queries = CASCADE_STATS["queries"]
+        report = {"queries": queries, "tiers": {}}
+
+        for tier, st in CASCADE_STATS["tiers"].items():
+            report["tiers"][tier] = {
+                "attempts": st["attempts"],
+                "hits": st["hits"],
+                "hit_rate": round(st["hits"] / queries, 4) if queries else 0.0,
+                "avg_ms": round(st["time_ms"] / st["attempts"], 3) if st["attempts"] else 0.0
+            }
+
+    return report
 
 # ---------------- FORMAT ----------------
 # ---------------- FORMAT ----------------
@@ -199,3 +943,15 @@ def format_answer(block):
             formatted.append(line)
 
     return "\n".join(formatted)
+
+
+# ---------------- INDEX BUILD CLI ----------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the semantic index and report encoding speed")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=ENCODE_WORKERS)
+    args = parser.parse_args()
+
+    build_vector_index(batch_size=args.batch_size, workers=args.workers)
@@ -1,51 +1,96 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
 import sys
 import os
-import cv2
+import re
+import json
 import threading
 import time
-presence_state = True
-camera_running = False
 # Add scripts folder to path
 sys.path.append(os.path.abspath("../scripts"))
 
-# Import engines
-from semantic_engine import search, format_answer, build_vector_index
-from interview_engine import start_interview, evaluate_answer, next_question, final_result
+# Import engines. Encoder pool workers (spawn) re-import this script, so
+# only the semantic engine they need is imported here; the interview
+# engine (second model) and presence engine (OpenCV) are imported where
+# they are used.
+from semantic_engine import search, format_answer, build_vector_index, index_stats, cascade_stats
 
 app = Flask(__name__)
 
-# Build semantic vector DB once at startup
-print("Loading knowledge base...")
-build_vector_index()
-print("Knowledge base loaded")
+
+def load_knowledge_base():
+    # Build semantic vector DB once at startup. Called from the run paths
+    # (__main__ below and the ASGI lifespan), not at import, so encoder
+    # pool workers re-importing this script never start a build.
+    print("Loading knowledge base...")
+    build_vector_index()
+
+    # load the interview model now instead of on the first /start_interview
+    import interview_engine  # noqa: F401
+
+    print("Knowledge base loaded")
+
 
 def camera_presence_loop():
-    global presence_state, camera_running
+    from interview_engine import SESSION
+    from presence_engine import presence_loop, open_source
 
-    cap = cv2.VideoCapture(0)
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    )
+    # interview pace while a viva is running, slow idle checks otherwise
+    presence_loop(open_source(), is_active=lambda: SESSION["active"])
 
-    camera_running = True
 
-    while camera_running:
-        ret, frame = cap.read()
-        if not ret:
-            continue
+# ================= TRAFFIC RECORDER =================
+# Opt-in: set LABBOT_TRAFFIC_LOG=/path/to/traffic.jsonl to record requests
+# for scripts/replay_traffic.py. Only the route, timing and scrubbed
+# payload are written (no IPs, cookies or headers).
+TRAFFIC_LOG = os.environ.get("LABBOT_TRAFFIC_LOG")
+RECORDED_ROUTES = {"/ask", "/start_interview", "/evaluate", "/draft_answer", "/presence_status"}
+traffic_lock = threading.Lock()
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"https?://\S+"), "<url>"),
+    (re.compile(r"\+?\d[\d\s-]{5,}\d"), "<number>")
+]
 
-        if len(faces) > 0:
-            presence_state = True
-        else:
-            presence_state = False
 
-        time.sleep(1)  # Check every 1 second
+def anonymize(text):
+    for pattern, repl in PII_PATTERNS:
+        text = pattern.sub(repl, text)
+    return text
+
+
+@app.before_request
+def start_traffic_timer():
+    g.request_start = time.time()
+
+
+@app.after_request
+def record_traffic(response):
+    if not TRAFFIC_LOG or request.path not in RECORDED_ROUTES:
+        return response
+
+    payload = request.get_json(silent=True) if request.method == "POST" else None
+    if isinstance(payload, dict):
+        payload = {k: anonymize(v) if isinstance(v, str) else v for k, v in payload.items()}
+
+    record = {
+        "ts": g.request_start,
+        "endpoint": request.path,
+        "method": request.method,
+        "payload": payload,
+        "status": response.status_code,
+        "latency_ms": round((time.time() - g.request_start) * 1000, 2)
+    }
+
+    try:
+        with traffic_lock, open(TRAFFIC_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print("TRAFFIC LOG ERROR:", e)
+
+    return response
+
 
-    cap.release()
 # ================= HOME =================
 @app.route("/")
 def home():
@@ -84,13 +129,15 @@ def ask():
 # ================= START INTERVIEW =================
 @app.route("/start_interview", methods=["GET"])
 def start_interview_route():
+    from interview_engine import start_interview, SESSION
+
     try:
         question = start_interview()
 
         if question is None:
             return jsonify({"question": None})
 
-        return jsonify({"question": question})
+        return jsonify({"question": question, "question_id": SESSION["question_id"]})
 
     except Exception as e:
         print("INTERVIEW START ERROR:", e)
@@ -100,6 +147,8 @@ def start_interview_route():
 # ================= EVALUATE ANSWER =================
 @app.route("/evaluate", methods=["POST"])
 def evaluate():
+    from interview_engine import evaluate_answer, next_question, final_result, SESSION
+
     try:
         data = request.get_json(silent=True)
 
@@ -138,7 +187,8 @@ def evaluate():
         return jsonify({
             "score": score,
             "feedback": feedback,
-            "next": next_q
+            "next": next_q,
+            "question_id": SESSION["question_id"]
         })
 
     except Exception as e:
@@ -152,12 +202,48 @@ def evaluate():
             "weak": []
         })
 
+# ================= DRAFT ANSWER (SPECULATIVE) =================
+# Called by the interview page while the student is still typing so the
+# answer is already encoded, and the next question ready, on submit.
+# The page does not wait for the reply; the encode runs on this request.
+@app.route("/draft_answer", methods=["POST"])
+def draft_answer():
+    from interview_engine import submit_draft
+
+    try:
+        data = request.get_json(silent=True)
+
+        if not data or "answer" not in data or "question_id" not in data:
+            return jsonify({"encoded": False})
+
+        encoded = submit_draft(data.get("answer", ""), data.get("question_id"))
+        return jsonify({"encoded": encoded})
+
+    except Exception as e:
+        print("DRAFT ERROR:", e)
+        return jsonify({"encoded": False})
+
+
 @app.route("/presence_status")
 def presence_status():
-    return jsonify({"present": presence_state})
+    from presence_engine import PRESENCE
+
+    return jsonify({"present": PRESENCE["present"]})
+
+
+@app.route("/stats")
+def stats():
+    from presence_engine import presence_stats
+
+    return jsonify({
+        "presence": presence_stats(),
+        "indexes": index_stats(),
+        "retrieval": cascade_stats()
+    })
 
 # ================= RUN =================
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
+    load_knowledge_base()
     threading.Thread(target=camera_presence_loop, daemon=True).start()
     app.run(host="0.0.0.0", port=port, threaded=True, debug=False)
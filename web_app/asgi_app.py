@@ -0,0 +1,287 @@
+"""
+ASGI serving mode for LabBot.
+
+Runs the existing Flask routes behind an admission gate so that encoder
+heavy requests (/ask, /evaluate) go through a bounded executor instead of
+one thread per request. When the gate is saturated the request is answered
+straight away with 429 (queue full) or 503 (queue deadline passed) plus a
+Retry-After header.
+
+Run from the web_app folder:
+    uvicorn asgi_app:app --port 10000
+or
+    python asgi_app.py
+
+Tuning (environment variables):
+    LABBOT_ENCODER_WORKERS   requests encoding at the same time   (default 2)
+    LABBOT_QUEUE_DEPTH       requests allowed to wait for a slot  (default 16)
+    LABBOT_QUEUE_DEADLINE    seconds a request may wait           (default 4 x the
+                                                                   average service time)
+"""
+
+import asyncio
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app, camera_presence_loop, load_knowledge_base
+
+ENCODER_WORKERS = int(os.environ.get("LABBOT_ENCODER_WORKERS", 2))
+QUEUE_DEPTH = int(os.environ.get("LABBOT_QUEUE_DEPTH", 16))
+QUEUE_DEADLINE = os.environ.get("LABBOT_QUEUE_DEADLINE")
+QUEUE_DEADLINE = float(QUEUE_DEADLINE) if QUEUE_DEADLINE else None
+
+# Without a fixed deadline a request may wait this many average service times
+DEADLINE_SERVICES = 4
+
+# Routes that call model.encode and must go through the gate
+GATED_PATHS = {"/ask", "/evaluate"}
+
+# Optional encoder work: goes through the gate too, but is dropped
+# outright instead of queued whenever the gate is busy
+SPECULATIVE_PATHS = {"/draft_answer"}
+
+
+# ================= ADMISSION GATE =================
+class Overloaded(Exception):
+    def __init__(self, status, retry_after):
+        super().__init__(status)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    Bounded executor with a bounded waiting room in front of it.
+    At most `workers` requests run, at most `depth` wait, and nobody
+    waits longer than `deadline` seconds (None = DEADLINE_SERVICES
+    average service times).
+    """
+
+    def __init__(self, workers, depth, deadline=None):
+        self.workers = workers
+        self.depth = depth
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+        self.slots = asyncio.Semaphore(workers)
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0, "speculative": 0}
+        self.avg_service = None  # seconds, moving average
+
+    def busy(self):
+        return self.waiting > 0 or self.in_flight >= self.workers
+
+    def service_time(self):
+        # a guess until the first request has been timed
+        return self.avg_service if self.avg_service is not None else 0.5
+
+    def queue_deadline(self):
+        if self.deadline is not None:
+            return self.deadline
+        return DEADLINE_SERVICES * self.service_time()
+
+    def retry_after(self):
+        # rough time until the queue in front of a new request drains
+        backlog = (self.waiting + self.in_flight) / max(self.workers, 1)
+        return max(1, math.ceil(backlog * self.service_time()))
+
+    async def run(self, fn, *args):
+        # requests beyond the free slots are the ones that would queue
+        if self.in_flight + self.waiting - self.workers >= self.depth:
+            self.rejected["queue_full"] += 1
+            raise Overloaded(429, self.retry_after())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_deadline())
+        except asyncio.TimeoutError:
+            self.rejected["deadline"] += 1
+            raise Overloaded(503, self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.in_flight += 1
+        start = time.perf_counter()
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.avg_service = elapsed if self.avg_service is None else 0.9 * self.avg_service + 0.1 * elapsed
+            self.in_flight -= 1
+            self.slots.release()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_depth_limit": self.depth,
+            "queue_deadline": round(self.queue_deadline(), 4),
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_seconds": round(self.service_time(), 4)
+        }
+
+
+gate = AdmissionGate(ENCODER_WORKERS, QUEUE_DEPTH, QUEUE_DEADLINE)
+
+
+# ================= WSGI BRIDGE =================
+def build_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body))
+    }
+
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin1").upper().replace("-", "_")
+        value = raw_value.decode("latin1")
+
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+
+        key = "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+
+    return environ
+
+
+def call_flask(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    chunks = flask_app.wsgi_app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    return response["status"], response["headers"], body
+
+
+async def read_body(receive):
+    body = b""
+    more = True
+
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+
+    return body
+
+
+async def send_response(send, status, headers, body):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    headers = [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+    headers.extend(extra_headers)
+    await send_response(send, status, headers, body)
+
+
+# ================= ASGI APP =================
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(load_knowledge_base)
+            threading.Thread(target=camera_presence_loop, daemon=True).start()
+            await send({"type": "lifespan.startup.complete"})
+
+        elif message["type"] == "lifespan.shutdown":
+            gate.executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    if scope["path"] == "/metrics":
+        await send_json(send, 200, gate.stats())
+        return
+
+    if scope["path"] in SPECULATIVE_PATHS and gate.busy():
+        gate.rejected["speculative"] += 1
+        await send_json(send, 503, {"encoded": False}, [("Retry-After", str(gate.retry_after()))])
+        return
+
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+
+    if scope["path"] not in GATED_PATHS and scope["path"] not in SPECULATIVE_PATHS:
+        # cheap routes (page, static files, presence) skip the gate
+        status, headers, payload = await asyncio.to_thread(call_flask, environ)
+        await send_response(send, status, headers, payload)
+        return
+
+    try:
+        status, headers, payload = await gate.run(call_flask, environ)
+    except Overloaded as e:
+        message = "Server is busy. Please retry shortly."
+        await send_json(
+            send,
+            e.status,
+            {"error": message, "answer": message},
+            [("Retry-After", str(e.retry_after))]
+        )
+        return
+
+    await send_response(send, status, headers, payload)
+
+
+# ================= RUN =================
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 10000))
+    uvicorn.run(app, host="0.0.0.0", port=port)